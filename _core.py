@@ -0,0 +1,152 @@
+# Núcleo de cálculo del servicio, sin dependencias de FastAPI para el routing.
+# Está anotado de forma estricta para poder compilarse con mypyc (`mypyc _core.py`);
+# sin compilar funciona igual como módulo Python normal.
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+from functools import lru_cache
+import sys
+import threading
+import numpy as np
+import numpy.typing as npt
+import orjson
+from fastapi import HTTPException
+from pyproj import Transformer
+
+# Internadas: todas las claves de las tablas de abajo comparten el mismo objeto str,
+# así las búsquedas resuelven por identidad antes de comparar caracteres
+EPSGS: Tuple[str, ...] = tuple(sys.intern(s) for s in ("EPSG:25829", "EPSG:25830", "EPSG:4326"))
+EPSG_25829, EPSG_25830, EPSG_4326 = EPSGS
+
+# Códigos EPSG enteros para construir los Transformer sin parsear la cadena "EPSG:xxxx"
+_EPSG_CODE: Dict[str, int] = {EPSG_25829: 25829, EPSG_25830: 25830, EPSG_4326: 4326}
+
+# Todos los pares (src, dst) se construyen al arrancar: en caliente solo hay un lookup
+TRANSFORMERS: Dict[Tuple[str, str], Transformer] = {
+    (a, b): Transformer.from_crs(_EPSG_CODE[a], _EPSG_CODE[b], always_xy=True)
+    for a in EPSGS for b in EPSGS if a != b
+}
+
+# A partir de este tamaño la transformación puede bloquear el event loop >1 ms
+BULK_THREAD_MIN = 1000
+# A partir de este tamaño la respuesta del bulk se emite en streaming
+BULK_STREAM_MIN = 10000
+
+# Los flujos de geocodificación repiten mucho los mismos puntos (ETL, snapping a rejilla).
+# Cada entrada ocupa ~320 bytes (clave, tupla resultado y nodo del LRU): 16384 entradas son
+# ~5 MB por worker, y esta cifra se multiplica por WEB_CONCURRENCY
+@lru_cache(maxsize=16384)
+def _transform_cached(x: float, y: float, src: str, dst: str) -> Tuple[float, float]:
+    # Con escalares pyproj (>=3.5) ya va directo al _transform_point en C
+    X, Y = TRANSFORMERS[(src, dst)].transform(x, y)
+    return X, Y
+
+def transform(x: float, y: float, src: str, dst: str) -> Tuple[float, float]:
+    if src == dst:
+        return x, y
+    try:
+        return _transform_cached(x, y, src, dst)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Transform error: {e}")
+
+def transform_many(
+    xs: npt.NDArray[np.float64], ys: npt.NDArray[np.float64], src: str, dst: str, inplace: bool = False
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    # Una sola llamada a PROJ para todo el array (bucle en C, no en Python)
+    if src == dst:
+        return xs, ys
+    try:
+        X, Y = TRANSFORMERS[(src, dst)].transform(xs, ys, inplace=inplace)
+        return X, Y
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Transform error: {e}")
+
+# Cada par (src, dst) se codifica como un entero pequeño para agrupar con numpy
+_PAIRS: List[Tuple[str, str]] = [(a, b) for a in EPSGS for b in EPSGS]
+_PAIR_CODE: Dict[Tuple[str, str], int] = {pair: code for code, pair in enumerate(_PAIRS)}
+
+# Buffers de trabajo del bulk, reutilizados entre peticiones del mismo hilo (el event loop
+# o un hilo del pool). Solo se guardan hasta _BULK_BUF_MAX puntos (1 MB por hilo); los lotes
+# mayores usan temporales para no dejar memoria retenida en cada hilo de por vida
+_bulk_buf = threading.local()
+_BULK_BUF_MIN = 4096
+_BULK_BUF_MAX = 65536
+
+def _bulk_buffers(n: int) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    if n > _BULK_BUF_MAX:
+        return np.empty(n, dtype=np.float64), np.empty(n, dtype=np.float64)
+    xb = getattr(_bulk_buf, "xb", None)
+    if xb is None or xb.size < n:
+        size = min(max(n, 2 * (0 if xb is None else xb.size), _BULK_BUF_MIN), _BULK_BUF_MAX)
+        _bulk_buf.xb = np.empty(size, dtype=np.float64)
+        _bulk_buf.yb = np.empty(size, dtype=np.float64)
+    return _bulk_buf.xb[:n], _bulk_buf.yb[:n]
+
+def transform_bulk(points: Sequence[Any]) -> Tuple[List[float], List[float]]:
+    n = len(points)
+    if n == 0:
+        return [], []
+    xs = np.fromiter((p.x for p in points), dtype=np.float64, count=n)
+    ys = np.fromiter((p.y for p in points), dtype=np.float64, count=n)
+    codes = np.fromiter((_PAIR_CODE[(p.src, p.dst)] for p in points), dtype=np.int8, count=n)
+
+    # Ordenar por par deja cada grupo contiguo en el buffer: PROJ transforma cada tramo
+    # in-place, sin copias por grupo ni arrays de salida nuevos
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    xb, yb = _bulk_buffers(n)
+    np.take(xs, order, out=xb)
+    np.take(ys, order, out=yb)
+    cuts = (np.flatnonzero(np.diff(sorted_codes)) + 1).tolist()
+    for start, end in zip([0] + cuts, cuts + [n]):
+        src, dst = _PAIRS[int(sorted_codes[start])]
+        transform_many(xb[start:end], yb[start:end], src, dst, inplace=True)
+    # Volver al orden original reutilizando los arrays de entrada
+    xs[order] = xb
+    ys[order] = yb
+    # round() y no np.round: este último no redondea correctamente en el 8º decimal y
+    # /reproject y /reproject/bulk deben devolver lo mismo para el mismo punto
+    return [round(v, 8) for v in xs.tolist()], [round(v, 8) for v in ys.tolist()]
+
+def do_bulk(points: Sequence[Any]) -> List[Dict[str, Any]]:
+    xs, ys = transform_bulk(points)
+    # Dicts planos: orjson los serializa en C sin pasar por el encoder de Pydantic
+    return [
+        {"x": xi, "y": yi, "src": p.src, "dst": p.dst}
+        for p, xi, yi in zip(points, xs, ys)
+    ]
+
+# Puntos por trozo al emitir el JSON del bulk en streaming
+BULK_STREAM_CHUNK = 2000
+
+def iter_bulk_json(
+    points: Sequence[Any], xs: List[float], ys: List[float], chunk: int = BULK_STREAM_CHUNK
+) -> Iterator[bytes]:
+    # Emite el array JSON por trozos: nunca se materializan a la vez los N dicts ni el
+    # documento completo. Las coordenadas ya vienen transformadas (los errores de
+    # transformación saltan antes de empezar a responder)
+    yield b"["
+    for start in range(0, len(points), chunk):
+        body = orjson.dumps([
+            {"x": xi, "y": yi, "src": p.src, "dst": p.dst}
+            for p, xi, yi in zip(points[start:start + chunk], xs[start:start + chunk], ys[start:start + chunk])
+        ])
+        yield (b"," if start else b"") + body[1:-1]
+    yield b"]"
+
+# Easting UTM del meridiano 6°W en el ecuador, con margen: a cualquier latitud norte el
+# meridiano queda más cerca del central, así que fuera de estos umbrales el huso es seguro
+_UTM_BOUNDARY_X: Dict[str, Tuple[float, float]] = {
+    EPSG_25829: (500000.0, 834000.0),  # x < CM (-9°) → 29; x > 834000 → al este de -6°
+    EPSG_25830: (166000.0, 500000.0),  # x < 166000 → al oeste de -6°; x ≥ CM (-3°) → 30
+}
+
+def is_zone29(x: float, y: float, crs: str) -> bool:
+    bounds = _UTM_BOUNDARY_X.get(crs)
+    if bounds is not None:
+        west, east = bounds
+        if x < west:
+            return True
+        if x >= east:
+            return False
+    # Zona dudosa (o EPSG:4326): longitud exacta con el Transformer precalculado
+    lon, _ = transform(x, y, crs, EPSG_4326)
+    return lon < -6.0
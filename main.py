@@ -1,27 +1,57 @@
-from fastapi import FastAPI, HTTPException
+import os
+import re
+import msgspec
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, validator
 from typing import Literal, List, Optional
-from pyproj import Transformer, CRS
+import asyncio
+from contextlib import asynccontextmanager
+import anyio
+from _core import (
+    EPSG_25829, EPSG_25830, EPSG_4326,
+    BULK_STREAM_MIN, BULK_THREAD_MIN, do_bulk, is_zone29, iter_bulk_json, transform, transform_bulk,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Hilos de anyio para el trabajo síncrono que queda (p. ej. emitir el bulk en streaming);
+    # PROJ libera el GIL, así que por defecto (40) se queda corto bajo carga
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("THREADPOOL_SIZE", "200"))
+    yield
 
 app = FastAPI(
     title="Reprojection Service",
     version="1.2.0",
-    description="Microservicio para reproyectar coordenadas entre EPSG:25829, EPSG:25830 y EPSG:4326"
+    description="Microservicio para reproyectar coordenadas entre EPSG:25829, EPSG:25830 y EPSG:4326",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-# CORS (permite llamadas desde n8n, front, etc.)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],   # Si quieres, cámbialo a tu dominio
-    allow_credentials=False,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-EPSG = Literal["EPSG:25829", "EPSG:25830", "EPSG:4326"]
+# CORS solo si se pide (ENABLE_CORS=1): las llamadas servidor a servidor (n8n, PostGIS)
+# no lo necesitan y así nos ahorramos el middleware en cada petición
+if os.getenv("ENABLE_CORS", "").lower() in ("1", "true", "yes"):
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",") if o.strip()],
+        allow_credentials=False,
+        allow_methods=["GET", "POST"],
+        allow_headers=["*"],
+    )
+
+# Construido con las constantes internadas de _core: pydantic y msgspec devuelven esos
+# mismos objetos, así que las búsquedas de _core resuelven por identidad
+EPSG = Literal[EPSG_25829, EPSG_25830, EPSG_4326]  # type: ignore[valid-type]
+
+# DTOs de entrada de solo lectura: frozen + extra="forbid" dejan al validador en el camino rápido
+# y los hacen hashables
+_INPUT_CONFIG = ConfigDict(frozen=True, extra="forbid", revalidate_instances="never")
 
 class ReprojectIn(BaseModel):
+    model_config = _INPUT_CONFIG
+
     x: float
     y: float
     src: EPSG
@@ -31,9 +61,38 @@ class ReprojectOut(ReprojectIn):
     ...
 
 class BulkReprojectIn(BaseModel):
+    model_config = _INPUT_CONFIG
+
     points: List[ReprojectIn]
 
+# Versión msgspec del body de /reproject/bulk: parsea y valida el JSON en una sola pasada
+# en C. BulkReprojectIn se mantiene solo para el esquema de /docs
+class PointIn(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
+    x: float
+    y: float
+    src: EPSG
+    dst: EPSG
+
+class BulkPointsIn(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
+    points: List[PointIn]
+
+# strict=False: como Pydantic, acepta números enviados como cadena (habitual desde n8n)
+_bulk_decoder = msgspec.json.Decoder(BulkPointsIn, strict=False)
+
+_MSGSPEC_PATH = re.compile(r"\.(\w+)|\[(\d+)\]")
+
+def _msgspec_errors(e: msgspec.DecodeError) -> List[dict]:
+    # Mismo formato que los 422 de FastAPI: [{"type", "loc", "msg", "input"}]
+    msg, _, path = str(e).partition(" - at `$")
+    loc: List[object] = ["body"]
+    for key, index in _MSGSPEC_PATH.findall(path.rstrip("`")):
+        loc.append(key or int(index))
+    kind = "value_error" if isinstance(e, msgspec.ValidationError) else "json_invalid"
+    return [{"type": kind, "loc": loc, "msg": msg, "input": None}]
+
 class DetectIn(BaseModel):
+    model_config = _INPUT_CONFIG
+
     lon: Optional[float] = Field(None, description="Longitud WGS84")
     lat: Optional[float] = Field(None, description="Latitud WGS84")
     x: Optional[float] = None
@@ -50,20 +109,12 @@ class DetectOut(BaseModel):
     zone: Literal["25829", "25830"]
     epsg: EPSG
 
-def _transform(x: float, y: float, src: str, dst: str):
-    try:
-        transformer = Transformer.from_crs(
-            CRS.from_user_input(src),
-            CRS.from_user_input(dst),
-            always_xy=True
-        )
-        X, Y = transformer.transform(x, y)
-        return X, Y
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Transform error: {e}")
+# Solo hay dos respuestas posibles: se construyen una vez y se comparten entre peticiones
+_DETECT_29 = DetectOut(zone="25829", epsg=EPSG_25829)
+_DETECT_30 = DetectOut(zone="25830", epsg=EPSG_25830)
 
 @app.get("/")
-def root():
+async def root():
     return {
         "service": "Reprojection Service",
         "version": "1.2.0",
@@ -71,30 +122,51 @@ def root():
     }
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 @app.post("/reproject", response_model=ReprojectOut)
-def reproject(p: ReprojectIn):
-    X, Y = _transform(p.x, p.y, p.src, p.dst)
-    return ReprojectOut(x=round(X, 8), y=round(Y, 8), src=p.src, dst=p.dst)
-
-@app.post("/reproject/bulk", response_model=List[ReprojectOut])
-def reproject_bulk(b: BulkReprojectIn):
-    out: List[ReprojectOut] = []
-    for p in b.points:
-        X, Y = _transform(p.x, p.y, p.src, p.dst)
-        out.append(ReprojectOut(x=round(X, 8), y=round(Y, 8), src=p.src, dst=p.dst))
-    return out
+async def reproject(p: ReprojectIn):
+    X, Y = transform(p.x, p.y, p.src, p.dst)
+    # src/dst ya vienen validados y X/Y son float de PROJ: no hace falta revalidar
+    return ReprojectOut.model_construct(x=round(X, 8), y=round(Y, 8), src=p.src, dst=p.dst)
+
+# Sin response_model ni body Pydantic: los esquemas solo se declaran para /docs
+@app.post(
+    "/reproject/bulk",
+    responses={200: {"model": List[ReprojectOut]}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {
+                "schema": BulkReprojectIn.model_json_schema(ref_template="#/components/schemas/{model}")
+            }},
+        }
+    },
+)
+async def reproject_bulk(request: Request):
+    try:
+        b = _bulk_decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise RequestValidationError(_msgspec_errors(e))
+    if len(b.points) >= BULK_STREAM_MIN:
+        # Lotes muy grandes: transformar fuera del loop y emitir el JSON por trozos
+        xs, ys = await asyncio.to_thread(transform_bulk, b.points)
+        return StreamingResponse(iter_bulk_json(b.points, xs, ys), media_type="application/json")
+    if len(b.points) >= BULK_THREAD_MIN:
+        # PROJ libera el GIL: el lote corre en otro hilo y el event loop sigue atendiendo
+        out = await asyncio.to_thread(do_bulk, b.points)
+    else:
+        out = do_bulk(b.points)
+    return ORJSONResponse(out)
 
 @app.post("/detect", response_model=DetectOut)
-def detect_zone(d: DetectIn):
+async def detect_zone(d: DetectIn):
     if d.lon is not None and d.lat is not None:
-        lon, _ = d.lon, d.lat
+        zone29 = d.lon < -6.0
     else:
         if d.x is None or d.y is None or d.crs is None:
             raise HTTPException(status_code=400, detail="Faltan parámetros (lon/lat o x/y/crs)")
-        lon, _ = _transform(d.x, d.y, d.crs, "EPSG:4326")
+        zone29 = is_zone29(d.x, d.y, d.crs)
 
-    zone = "25829" if lon < -6.0 else "25830"
-    return DetectOut(zone=zone, epsg=f"EPSG:{zone}")
+    return _DETECT_29 if zone29 else _DETECT_30